@@ -7,6 +7,9 @@ import pandas as pd
 import pyvisa
 from pycicl.rigol.oscilloscope import RigolMSO5
 from pycicl.siglent.siggen import SiglentSDG
+from pycicl.planner import plan, log_step_cost, range_cost
+from pycicl.sweep import capture_sweep_bode
+from pycicl.lockin import measure_gain
 
 @click.command()
 @click.option('--siggen_id', '-g', prompt='DS1022 VISA ID', help='VISA ID of the DS1022 signal generator')
@@ -15,8 +18,16 @@ from pycicl.siglent.siggen import SiglentSDG
 @click.option('--min_freq', '-m', default=100e3, help='Starting frequency')
 @click.option('--max_freq', '-x', default=25e6, help='Ending frequency')
 @click.option('--count', '-c', default=20, help='Frequency steps')
-@click.option('--frequency', '-f', default=[], type=float, help='Extra frequencies to test at', multiple=True)
-def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency):
+@click.option('--frequency', '-f', default=[], type=float, help='Extra frequencies to test at. Not used with --hardware_sweep', multiple=True)
+@click.option('--monotonic/--planned', default=False, help='Visit frequencies in ascending order instead of the cheapest order')
+@click.option('--hardware_sweep', is_flag=True, help='Capture the whole response from one generator sweep instead of stepping. Both scope channels are set to fit the input, so the output must not be larger')
+@click.option('--sweep_time', default=1.0, help='Duration of the hardware sweep in seconds')
+@click.option('--trigger_source', default='CHAN4', help='Scope trigger source wired to the generator trigger output')
+@click.option('--lockin', is_flag=True, help='Demodulate captured waveforms at each step instead of averaging scope statistics')
+def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency, monotonic, hardware_sweep, sweep_time, trigger_source, lockin):
+    if hardware_sweep and (frequency or lockin):
+        raise click.UsageError('--frequency and --lockin can not be used with --hardware_sweep')
+
     rm = pyvisa.ResourceManager()
 
     siggen = SiglentSDG(siggen_id, rm)
@@ -38,8 +49,26 @@ def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency):
     siggen.ch1.enabled = True
     siggen.ch1.voltage_unit = 'VRMS'
 
+    # Phase is in degrees and positive when the output lags the input, the same as the scope's RRPHASE measurement
     data = []
 
+    if hardware_sweep:
+        # the generator amplitude can't change part way through a sweep, so use the lower of the two targets if needed
+        vin_target = 3.535 if max_freq < 20e6 else 1.767
+        siggen.ch1.load = '50'
+        siggen.ch1.vrms = vin_target
+
+        # nothing autoscales during the sweep, so fit both channels to the input with some headroom
+        scale = 1.25 * 2 * np.sqrt(2) * vin_target / scope.vertical_divisions
+        scope.write_settings({f'ch{i:d}.{k}': v for i in (1, 2) for k, v in (('vernier', True), ('scale', scale), ('offset', 0.0))})
+        f, vin, vout, gain = capture_sweep_bode(siggen.ch1, scope, 1, 2, min_freq, max_freq, sweep_time, trigger_source, points=count)
+        data = list(zip(f, np.full(len(f), vin_target), np.abs(vin) / np.sqrt(2), np.abs(vout) / np.sqrt(2), np.abs(gain), -np.degrees(np.angle(gain))))
+
+        df = pd.DataFrame(data=data, columns=['Frequency', 'VinTarget', 'Vin', 'Vout', 'Gain', 'Phase'])
+        df.to_csv(output)
+        print(f'wrote to {output}')
+        return
+
     scope.clear_measurements()
 
     def format_freq(freq):
@@ -54,9 +83,15 @@ def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency):
         else:
             return f'{freq/1e9:.3f} Ghz'
 
-    with click.progressbar(frequency_space, label='Performing frequency sweep', item_show_func=format_freq) as bar:
-        for f in bar:
-            vin_target = 3.535 if f < 20e6 else 1.767
+    # order the sweep to minimize generator settling and re-ranging when vin_target changes
+    points = [{'frequency': f, 'vin_target': 3.535 if f < 20e6 else 1.767} for f in frequency_space]
+    costs = {'frequency': log_step_cost(0.5, fixed=0.1), 'vin_target': range_cost([2.0], 4.0)}
+    points = plan(points, costs, monotonic='frequency' if monotonic else None)
+
+    with click.progressbar(points, label='Performing frequency sweep', item_show_func=lambda p: format_freq(p and p['frequency'])) as bar:
+        for point in bar:
+            f = point['frequency']
+            vin_target = point['vin_target']
 
             pvrms1 = scope.ch1.pvrms
             pvrms2 = scope.ch2.pvrms
@@ -77,6 +112,20 @@ def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency):
             time.sleep(0.1)
 
             scope.autoscale()
+
+            if lockin:
+                # one capture gives gain and phase directly, with no need to wait for statistics to settle.
+                # capture enough periods for each of the default 8 lock-in segments to hold min_cycles of them
+                periods = 64
+                scope.timebase = scope.timebase_step(periods / f / scope.timebase_divisions)
+                scope.single()
+                scope.wait_for_stop()
+                result = measure_gain(scope.ch1.read_waveform(), scope.ch2.read_waveform(), siggen.ch1.frequency)
+                scope.run()
+                data.append((f, vin_target, abs(result.vin[0]) / np.sqrt(2), abs(result.vout[0]) / np.sqrt(2),
+                             abs(result.gain[0]), -result.phase[0]))
+                continue
+
             scope.reset_statistics()
             time.sleep(4)
             vout = pvrms2.avg
@@ -88,6 +137,7 @@ def run(siggen_id, scope_id, output, min_freq, max_freq, count, frequency):
             vout = pvrms2.avg
             data.append((f, vin_target, vin, vout, vout/vin, phase.avg))
 
+    data.sort()
     df = pd.DataFrame(data=data, columns=['Frequency', 'VinTarget', 'Vin', 'Vout', 'Gain', 'Phase'])
     df.to_csv(output)
     print(f'wrote to {output}')
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from pycicl.waveform import Waveform
+
+
+class EnvelopeIndex:
+    """
+    A multiresolution min/max/mean index over a large 1D array, for plotting or scanning long captures.
+    Level 0 summarizes blocks of `base` samples, and each level above summarizes `factor` blocks of the one below.
+    Levels are built lazily on first use, reading the data in chunks, so the data itself can be a numpy memmap.
+    If a path is given, levels are stored beside it as .npy files and memory mapped on later use
+    """
+
+    chunk_size = 1 << 22
+
+    def __init__(self, data, base: int = 64, factor: int = 8, path: str = None):
+        """
+        :param data: a 1D array-like, or a Waveform, in which case queries return volts
+        :param base: samples per level 0 block
+        :param factor: blocks per block of the next level up
+        :param path: path of the data file. Index files are written next to it as path.env*.npy, and rebuilt
+            if the data file's size or modification time has changed since
+        """
+        self.waveform = data if isinstance(data, Waveform) else None
+        self.data = data.codes if isinstance(data, Waveform) else data
+        self.base = base
+        self.factor = factor
+        self.path = path
+        self._levels = None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def levels(self) -> list:
+        """One (blocks, 3) array of [min, max, sum] per level, finest first"""
+        if self._levels is None:
+            self._levels = self._load() if self.path is not None else None
+            if self._levels is None:
+                self._levels = self._build()
+        return self._levels
+
+    def block_size(self, level: int) -> int:
+        """Samples per block at a level, with level -1 being the raw data"""
+        return 1 if level < 0 else self.base * self.factor ** level
+
+    def _metadata(self) -> dict:
+        metadata = {'length': len(self.data), 'base': self.base, 'factor': self.factor}
+        if self.path is not None and os.path.exists(self.path):
+            # a new capture written to the same path invalidates the index even if its length is unchanged
+            stat = os.stat(self.path)
+            metadata.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+        return metadata
+
+    def _level_path(self, level: int) -> str:
+        return f'{self.path}.env{level:d}.npy'
+
+    def _load(self):
+        try:
+            with open(f'{self.path}.env.json') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if {k: metadata.get(k) for k in self._metadata()} != self._metadata():
+            return None
+        return [np.load(self._level_path(k), mmap_mode='r') for k in range(metadata['levels'])]
+
+    def _allocate(self, level: int, blocks: int) -> np.ndarray:
+        if self.path is None:
+            return np.empty((blocks, 3))
+        return np.lib.format.open_memmap(self._level_path(level), mode='w+', dtype=np.float64, shape=(blocks, 3))
+
+    @staticmethod
+    def _summarize(source, out, group: int, chunk_size: int, reduce) -> None:
+        """Fill out[i] with [min, max, sum] of each group of `group` items of source"""
+        n = len(source)
+        step = max(chunk_size // group, 1) * group
+        for first in range(0, n, step):
+            chunk = np.asarray(source[first:min(first + step, n)])
+            full = len(chunk) // group * group
+            row = first // group
+
+            if full:
+                blocks = chunk[:full].reshape(full // group, group, *chunk.shape[1:])
+                out[row:row + len(blocks)] = reduce(blocks)
+                row += len(blocks)
+            if full < len(chunk):
+                out[row] = reduce(chunk[full:][np.newaxis])[0]
+
+    def _build(self) -> list:
+        levels = []
+
+        # level 0 summarizes the raw data
+        level = self._allocate(0, -(-len(self.data) // self.base))
+        self._summarize(self.data, level, self.base, self.chunk_size,
+                        lambda b: np.column_stack((b.min(axis=1), b.max(axis=1), b.sum(axis=1, dtype=np.float64))))
+        levels.append(level)
+
+        # each level above summarizes the one below
+        while len(levels[-1]) > self.factor:
+            below = levels[-1]
+            level = self._allocate(len(levels), -(-len(below) // self.factor))
+            self._summarize(below, level, self.factor, self.chunk_size,
+                            lambda b: np.column_stack((b[:, :, 0].min(axis=1), b[:, :, 1].max(axis=1), b[:, :, 2].sum(axis=1))))
+            levels.append(level)
+
+        if self.path is not None:
+            for level in levels:
+                level.flush()
+            with open(f'{self.path}.env.json', 'w') as f:
+                json.dump({**self._metadata(), 'levels': len(levels)}, f)
+            levels = [np.load(self._level_path(k), mmap_mode='r') for k in range(len(levels))]
+
+        return levels
+
+    def _gather(self, level: int, starts, stops) -> tuple:
+        """Reduce the items [starts[i], stops[i]) of a level to (min, max, sum) for each i, with empty ranges as identities"""
+        lengths = np.maximum(stops - starts, 0)
+        total = int(lengths.sum())
+        result_min = np.full(len(starts), np.inf)
+        result_max = np.full(len(starts), -np.inf)
+        result_sum = np.zeros(len(starts))
+        if total == 0:
+            return result_min, result_max, result_sum
+
+        offsets = np.cumsum(lengths) - lengths
+        index = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+        nonempty = lengths > 0
+        group_starts = offsets[nonempty]
+
+        if level < 0:
+            values = np.asarray(self.data[index], dtype=np.float64)
+            mins = maxs = sums = values
+        else:
+            values = np.asarray(self.levels[level][index])
+            mins, maxs, sums = values[:, 0], values[:, 1], values[:, 2]
+
+        result_min[nonempty] = np.minimum.reduceat(mins, group_starts)
+        result_max[nonempty] = np.maximum.reduceat(maxs, group_starts)
+        result_sum[nonempty] = np.add.reduceat(sums, group_starts)
+        return result_min, result_max, result_sum
+
+    def query(self, start: int = 0, stop: int = None, bins: int = 1000) -> tuple:
+        """
+        Summarize a range of samples into bins
+        Each bin is assembled from whole blocks of the coarsest usable level, plus at most a few blocks of each
+        finer level at its edges, so the cost is proportional to the number of bins rather than the range
+        :param start: first sample
+        :param stop: end of the range, exclusive. Defaults to the end of the data
+        :param bins: number of bins. Reduced if the range has fewer samples than this
+        :return: (edges, min, max, mean), where edges has bins + 1 sample indices bounding the bins
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if not 0 <= start < stop:
+            raise ValueError(f'Invalid range [{start}, {stop})')
+
+        bins = min(bins, stop - start)
+        edges = np.linspace(start, stop, bins + 1).astype(np.int64)
+        width = int(np.diff(edges).min())
+
+        # use the coarsest level where every bin contains at least one whole block
+        top = -1
+        while top + 1 < len(self.levels) and 2 * self.block_size(top + 1) <= width:
+            top += 1
+
+        left, right = edges[:-1], edges[1:]
+        if top < 0:
+            result = self._gather(-1, left, right)
+        else:
+            top_size = self.block_size(top)
+            result = self._gather(top, -(-left // top_size), right // top_size)
+            for level in range(-1, top):
+                size = self.block_size(level)
+                ratio = self.block_size(level + 1) // size
+                # the part of the bin after its left edge and the part before its right edge that aren't covered by
+                # whole blocks of the next level up
+                for first, last in ((-(-left // size), -(-left // (size * ratio)) * ratio),
+                                    (right // (size * ratio) * ratio, right // size)):
+                    mins, maxs, sums = self._gather(level, first, last)
+                    result = (np.minimum(result[0], mins), np.maximum(result[1], maxs), result[2] + sums)
+
+        minimum, maximum, total = result
+        mean = total / (right - left)
+
+        if self.waveform is not None:
+            minimum, maximum, mean = (self.waveform.to_volts(v) for v in (minimum, maximum, mean))
+            if self.waveform.yincrement < 0:
+                minimum, maximum = maximum, minimum
+
+        return edges, minimum, maximum, mean
+
+    def remove(self) -> None:
+        """Delete the index files for this data"""
+        if self.path is None:
+            return
+        if os.path.exists(f'{self.path}.env.json'):
+            os.remove(f'{self.path}.env.json')
+        level = 0
+        while os.path.exists(self._level_path(level)):
+            os.remove(self._level_path(level))
+            level += 1
+        self._levels = None
@@ -36,7 +36,7 @@ class MultiChannelInstrument(Instrument):
 
     def __init__(self):
         # setup channels
-        self.channels = (self.Channel(self, i+1) for i in range(self.channel_count))
+        self.channels = tuple(self.Channel(self, i+1) for i in range(self.channel_count))
 
         # setup ch1, ch2, etc. attributes for easy access
         for i, c in enumerate(self.channels, start=1):
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+
+from pycicl.waveform import Waveform
+
+
+def _as_samples(x):
+    """Stack a Waveform, a sequence of equal length Waveforms, or an array into an array of volts"""
+    if isinstance(x, Waveform):
+        return x.voltage(), x.sample_rate
+    if len(x) and isinstance(x[0], Waveform):
+        return np.stack([w.voltage() for w in x]), x[0].sample_rate
+    return np.asarray(x, dtype=np.float64), None
+
+
+def demodulate(x, frequency, harmonics: Sequence[int] = (1,), sample_rate: float = None, segments: int = 8,
+               min_cycles: float = 8) -> tuple:
+    """
+    Digital lock-in: measure the complex amplitude of a signal at a known frequency and its harmonics.
+    The record is split into segments, each is Hann windowed and mixed with a reference at each harmonic,
+    and the segment results are averaged. The spread between segments gives the noise estimate
+    :param x: samples with shape (..., n) to demodulate a batch of captures at once, or Waveform(s)
+    :param frequency: fundamental frequency in Hz, either a scalar or one per capture
+    :param harmonics: harmonic numbers to measure
+    :param sample_rate: sample rate in Sa/s, taken from the Waveform if x is one
+    :param segments: number of segments to split each record into for the noise estimate. Reduced if needed so each
+        segment holds at least min_cycles periods of the lowest frequency measured
+    :param min_cycles: fewest periods of the lowest frequency a segment can hold. Shorter segments leak enough
+        of the other harmonics through the window to bias the amplitude and inflate the noise estimate
+    :return: (amplitude, noise), each shaped (..., len(harmonics)). amplitude is the complex peak amplitude
+        with phase relative to the first sample, and noise is the standard error of its estimate
+    """
+    x, waveform_rate = _as_samples(x)
+    sample_rate = waveform_rate if sample_rate is None else sample_rate
+    if sample_rate is None:
+        raise ValueError('A sample rate is needed when demodulating raw arrays')
+
+    harmonics = np.asarray(harmonics, dtype=np.float64)
+    omega = 2 * np.pi * np.asarray(frequency, dtype=np.float64)[..., None] * harmonics  # (..., H)
+    if np.any(omega / (2 * np.pi) >= sample_rate / 2):
+        raise ValueError('Harmonics above the Nyquist frequency can not be measured')
+
+    # use fewer segments if they would be too short to separate the lowest frequency from its neighbours
+    cycles = x.shape[-1] * np.min(omega) / (2 * np.pi * sample_rate)
+    if cycles < min_cycles:
+        raise ValueError(f'Record holds {cycles:.3g} periods of the lowest frequency, at least {min_cycles:g} are needed')
+    segments = max(min(segments, int(cycles // min_cycles)), 1)
+
+    # split each record into equal segments, dropping any remainder
+    length = x.shape[-1] // segments
+    if length < 2:
+        raise ValueError(f'Record of {x.shape[-1]} samples is too short for {segments} segments')
+    x = x[..., :length * segments].reshape(*x.shape[:-1], segments, length)  # (..., K, m)
+
+    # remove each segment's offset, which the window would otherwise leak into every harmonic
+    x = x - x.mean(axis=-1, keepdims=True)
+
+    t = np.arange(length) / sample_rate
+    window = np.sin(np.pi * (np.arange(length) + 0.5) / length) ** 2
+
+    # the reference for each segment is the same apart from a phase offset for the segment's start time
+    reference = np.exp(-1j * omega[..., None, :] * t[:, None])  # (..., m, H)
+    offset = np.exp(-1j * omega[..., None, :] * (np.arange(segments) * length / sample_rate)[:, None])  # (..., K, H)
+    phasors = 2 * np.matmul(x * window, reference) * offset / window.sum()  # (..., K, H)
+
+    amplitude = phasors.mean(axis=-2)
+    if segments > 1:
+        noise = np.sqrt(np.sum(np.abs(phasors - amplitude[..., None, :]) ** 2, axis=-2) / (segments - 1) / segments)
+    else:
+        noise = np.full(amplitude.shape, np.nan)
+    return amplitude, noise
+
+
+class LockInResult:
+    """Complex amplitudes of a stimulus and response at each harmonic, and the gain between them"""
+
+    def __init__(self, frequency, harmonics, vin, vin_noise, vout, vout_noise):
+        self.frequency = frequency
+        self.harmonics = tuple(harmonics)
+        self.vin = vin
+        self.vin_noise = vin_noise
+        self.vout = vout
+        self.vout_noise = vout_noise
+
+    @property
+    def gain(self):
+        """Complex gain vout / vin at each harmonic"""
+        return self.vout / self.vin
+
+    @property
+    def gain_noise(self):
+        """Standard error of the gain's magnitude"""
+        return np.abs(self.gain) * np.hypot(self.vout_noise / np.abs(self.vout), self.vin_noise / np.abs(self.vin))
+
+    @property
+    def phase(self):
+        """Phase of the gain in degrees"""
+        return np.degrees(np.angle(self.gain))
+
+    def harmonic(self, n: int) -> int:
+        """Index of harmonic n in the result's last axis"""
+        return self.harmonics.index(n)
+
+
+def measure_gain(vin, vout, frequency, harmonics: Sequence[int] = (1,), sample_rate: float = None,
+                 segments: int = 8) -> LockInResult:
+    """
+    Measure the gain from vin to vout at a known stimulus frequency and its harmonics
+    :param vin: stimulus capture(s), see demodulate()
+    :param vout: response capture(s), sampled at the same times as vin
+    :param frequency: stimulus frequency in Hz, e.g. from SiglentSDG.Channel.frequency. Scalar or one per capture
+    :param harmonics: harmonic numbers to measure
+    :param sample_rate: sample rate in Sa/s, taken from the Waveforms if given
+    :param segments: number of segments to split each record into for the noise estimate, see demodulate()
+    """
+    vin_amplitude, vin_noise = demodulate(vin, frequency, harmonics, sample_rate, segments)
+    vout_amplitude, vout_noise = demodulate(vout, frequency, harmonics, sample_rate, segments)
+    return LockInResult(frequency, harmonics, vin_amplitude, vin_noise, vout_amplitude, vout_noise)
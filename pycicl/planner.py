@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import bisect
+import math
+from typing import Callable, Mapping, Sequence
+
+# A cost function takes the old and new value of a setting and returns the time in seconds it costs to change it
+CostFunction = Callable[[object, object], float]
+
+
+def fixed_cost(seconds: float) -> CostFunction:
+    """A setting that costs the same to change no matter how far it moves, e.g. a load change"""
+    return lambda old, new: 0.0 if old == new else seconds
+
+
+def log_step_cost(per_decade: float, fixed: float = 0.0) -> CostFunction:
+    """
+    A setting whose settle time grows with the size of the step, e.g. generator frequency or scope timebase
+    :param per_decade: seconds per decade of change
+    :param fixed: seconds for any change at all
+    """
+    def cost(old, new):
+        if old == new:
+            return 0.0
+        return fixed + per_decade * abs(math.log10(new / old))
+    return cost
+
+
+def range_cost(boundaries: Sequence[float], seconds: float) -> CostFunction:
+    """
+    A setting that only costs time when it crosses into a different range, e.g. scope vertical scale re-ranging
+    :param boundaries: the values where the instrument switches range
+    :param seconds: seconds per boundary crossed
+    """
+    boundaries = sorted(boundaries)
+
+    def cost(old, new):
+        return seconds * abs(bisect.bisect(boundaries, new) - bisect.bisect(boundaries, old))
+    return cost
+
+
+def step_cost(a: Mapping, b: Mapping, costs: Mapping[str, CostFunction | float]) -> float:
+    """
+    The cost of moving between two points
+    :param a: settings at the first point
+    :param b: settings at the second point
+    :param costs: cost function for each setting, or a number as shorthand for fixed_cost()
+    """
+    total = 0.0
+    for name, cost in costs.items():
+        if name not in a or name not in b:
+            continue
+        if callable(cost):
+            total += cost(a[name], b[name])
+        elif a[name] != b[name]:
+            total += cost
+    return total
+
+
+def total_cost(points: Sequence[Mapping], costs: Mapping[str, CostFunction | float], start: Mapping = None) -> float:
+    """The total reconfiguration cost of visiting points in the given order"""
+    path = ([start] if start is not None else []) + list(points)
+    return sum(step_cost(a, b, costs) for a, b in zip(path, path[1:]))
+
+
+def plan(points: Sequence[Mapping], costs: Mapping[str, CostFunction | float], start: Mapping = None,
+         monotonic: str = None, reverse: bool = False) -> list:
+    """
+    Order sweep points to minimize the total cost of reconfiguring the instruments between them
+    :param points: settings at each point, e.g. [{'frequency': 1e6, 'vin_target': 3.535}, ...]
+    :param costs: cost function for each setting, or a number as shorthand for fixed_cost()
+    :param start: the instruments' current settings, if known
+    :param monotonic: force points to be visited in order of this setting, for hysteresis-sensitive sweeps.
+        Only points with equal values of it are reordered
+    :param reverse: visit the monotonic setting in descending order
+    :return: the points, reordered
+    """
+    points = list(points)
+    if len(points) < 2:
+        return points
+
+    if monotonic is not None:
+        ordered = []
+        points.sort(key=lambda p: p[monotonic], reverse=reverse)
+        group = [points[0]]
+        for point in points[1:]:
+            if point[monotonic] == group[0][monotonic]:
+                group.append(point)
+            else:
+                ordered += plan(group, costs, start=ordered[-1] if ordered else start)
+                group = [point]
+        ordered += plan(group, costs, start=ordered[-1] if ordered else start)
+        return ordered
+
+    n = len(points)
+    cost = [[step_cost(a, b, costs) for b in points] for a in points]
+    start_cost = [step_cost(start, p, costs) if start is not None else 0.0 for p in points]
+
+    def path_cost(path):
+        return start_cost[path[0]] + sum(cost[i][j] for i, j in zip(path, path[1:]))
+
+    def nearest_neighbour(first):
+        path = [first]
+        remaining = set(range(n)) - {first}
+        while remaining:
+            last = path[-1]
+            nxt = min(remaining, key=lambda j: (cost[last][j], j))
+            path.append(nxt)
+            remaining.remove(nxt)
+        return path
+
+    # a known start point fixes where the path begins, otherwise try every point as the first
+    firsts = [min(range(n), key=lambda i: (start_cost[i], i))] if start is not None else range(n)
+    best = min((nearest_neighbour(i) for i in firsts), key=path_cost)
+
+    # improve with 2-opt moves on the open path until none help
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                if path_cost(candidate) < path_cost(best) - 1e-12:
+                    best = candidate
+                    improved = True
+
+    return [points[i] for i in best]
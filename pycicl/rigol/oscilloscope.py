@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod, abstractproperty
+import math
+import time
 
 import pycicl.instrument as instrument
 import pycicl.scpi as scpi
@@ -8,6 +10,7 @@ import pycicl.scpi as scpi
 
 class RigolMSO5(scpi.SCPIInstrument, instrument.Oscilloscope):
     channel_count = 4
+    default_port = 5555
 
     class Measurement(scpi.SCPIChild):
         def __init__(self, parent: RigolMSO5, name: str, src):
@@ -19,39 +22,78 @@ class RigolMSO5(scpi.SCPIInstrument, instrument.Oscilloscope):
             except TypeError:
                 self.src = (self.src,)
 
-        def enable(self):
-            self.resource.write(f'MEASURE:ITEM {self._suffix()}')
-
-        def _suffix(self):
-            return ",".join((self.name, *self.src))
+        @property
+        def item(self) -> str:
+            """The measurement item and its sources, e.g. 'VMAX,CHAN1'"""
+            return ",".join((self.name, *(str(s) for s in self.src)))
 
-        @staticmethod
-        def _mk_statistic(statistic):
-            return lambda obj: ",".join((statistic, obj.name, *(str(s) for s in obj.src)))
+        def enable(self):
+            self.resource.write(f'MEASURE:ITEM {self.item}')
 
-        current = scpi.SCPIProperty('MEASURE:STATISTIC:ITEM', suffix=_mk_statistic('CURR'), formatter=scpi.format_real, writable=False)
-        max = scpi.SCPIProperty('MEASURE:STATISTIC:ITEM', suffix=_mk_statistic('MAX'), formatter=scpi.format_real, writable=False)
-        min = scpi.SCPIProperty('MEASURE:STATISTIC:ITEM', suffix=_mk_statistic('MIN'), formatter=scpi.format_real, writable=False)
-        avg = scpi.SCPIProperty('MEASURE:STATISTIC:ITEM', suffix=_mk_statistic('AVER'), formatter=scpi.format_real, writable=False)
+        _commands = (
+            # attribute  command                   formatter         access  limits  suffix
+            ('current',  'MEASURE:STATISTIC:ITEM', scpi.format_real, 'r',    None,   'CURR,{item}'),
+            ('max',      'MEASURE:STATISTIC:ITEM', scpi.format_real, 'r',    None,   'MAX,{item}'),
+            ('min',      'MEASURE:STATISTIC:ITEM', scpi.format_real, 'r',    None,   'MIN,{item}'),
+            ('avg',      'MEASURE:STATISTIC:ITEM', scpi.format_real, 'r',    None,   'AVER,{item}'),
+        )
 
     class Channel(instrument.Oscilloscope.Channel, scpi.SCPIChild, ABC):
-        @staticmethod
-        def _mk_channel(name):
-            return lambda obj: name.format(obj.index)
-
-        bwlimit = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:BWLIMIT'))
-        coupling = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:COUPLING'))
-        display = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:DISPLAY'), formatter=scpi.format_onoff)
-        invert = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:INVERT'), formatter=scpi.format_onoff)
-        offset = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:OFFSET'), formatter=scpi.format_real)
-        tcalibrate = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:TCALIBRATE'), formatter=scpi.format_real)
         scale_min = 500e-6
         scale_max = 10
-        scale = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:SCALE'), formatter=scpi.format_real)
-        probe = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:PROBE'))  # add support for discretes?
-        units = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:UNITS'))
-        vernier = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:VERNIER'), formatter=scpi.format_onoff)
-        position = scpi.SCPIProperty(_mk_channel('CHANNEL{:d}:POSITION'), formatter=scpi.format_real)
+
+        _commands = (
+            # attribute     command                         formatter           access  limits
+            ('bwlimit',     'CHANNEL{index:d}:BWLIMIT',     scpi.format_str),
+            ('coupling',    'CHANNEL{index:d}:COUPLING',    scpi.format_str),
+            ('display',     'CHANNEL{index:d}:DISPLAY',     scpi.format_onoff),
+            ('invert',      'CHANNEL{index:d}:INVERT',      scpi.format_onoff),
+            ('offset',      'CHANNEL{index:d}:OFFSET',      scpi.format_real),
+            ('tcalibrate',  'CHANNEL{index:d}:TCALIBRATE',  scpi.format_real),
+            ('scale',       'CHANNEL{index:d}:SCALE',       scpi.format_real,   'rw',   ('scale_min', 'scale_max')),
+            ('probe',       'CHANNEL{index:d}:PROBE',       scpi.format_str),  # add support for discretes?
+            ('units',       'CHANNEL{index:d}:UNITS',       scpi.format_str),
+            ('vernier',     'CHANNEL{index:d}:VERNIER',     scpi.format_onoff),
+            ('position',    'CHANNEL{index:d}:POSITION',    scpi.format_real),
+        )
+
+        waveform_chunk_size = 250000  # maximum points per WAVEFORM:DATA? read in BYTE format
+
+        def read_waveform(self, raw: bool = True, out=None, path: str = None):
+            """
+            Read this channel's waveform
+            :param raw: read the full acquisition memory rather than the displayed points. The scope must be stopped
+            :param out: optional preallocated uint8 array (e.g. a numpy memmap) to read the samples into
+            :param path: if given, write the samples straight to this .npy file and return it memory mapped
+            :return: A pycicl.waveform.Waveform
+            """
+            import numpy as np
+            from pycicl.waveform import Waveform
+
+            resource = self.resource
+            resource.write(f'WAVEFORM:SOURCE CHANNEL{self.index:d};:WAVEFORM:MODE {"RAW" if raw else "NORMAL"};:WAVEFORM:FORMAT BYTE')
+
+            # format, type, points, count, xincrement, xorigin, xreference, yincrement, yorigin, yreference
+            preamble = resource.query('WAVEFORM:PREAMBLE?').strip().split(',')
+            points = int(preamble[2])
+            xincrement, xorigin, xreference, yincrement, yorigin, yreference = (float(v) for v in preamble[4:10])
+
+            if out is not None:
+                codes = out[:points]
+            elif path is not None:
+                codes = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(points,))
+            else:
+                codes = np.empty(points, dtype=np.uint8)
+            for start in range(0, points, self.waveform_chunk_size):
+                stop = min(start + self.waveform_chunk_size, points)
+                resource.write(f'WAVEFORM:START {start + 1:d};:WAVEFORM:STOP {stop:d}')
+                if hasattr(resource, 'query_block_into'):
+                    resource.query_block_into('WAVEFORM:DATA?', codes[start:stop])
+                else:
+                    block = resource.query_binary_values('WAVEFORM:DATA?', datatype='B', container=bytes)
+                    codes[start:stop] = np.frombuffer(block, dtype=np.uint8)
+
+            return Waveform(codes, xincrement, xorigin - xreference * xincrement, yincrement, yorigin + yreference)
 
         def __init__(self, parent: RigolMSO5, index: int):
             instrument.Oscilloscope.Channel.__init__(self, parent, index)
@@ -66,11 +108,56 @@ class RigolMSO5(scpi.SCPIInstrument, instrument.Oscilloscope):
             for name in measurements:
                 setattr(self, name.lower(), RigolMSO5.Measurement(parent, name, (f'CHAN{self.index:d}',)))
 
-    timebase = scpi.SCPIProperty('TIMEBASE:SCALE', formatter=scpi.format_real)
     timebase_min = 1e-9
     timebase_max = 1e3
     timebase_divisions = 14
-    statistics = scpi.SCPIProperty('MEASURE:STATISTIC:DISPLAY', formatter=scpi.format_onoff)
+    vertical_divisions = 8
+    # ACQUIRE:MDEPTH settings and the points they hold. The deepest settings need channels to be interleaved
+    memory_depths = {'1k': 1e3, '10k': 1e4, '100k': 1e5, '1M': 1e6, '10M': 1e7, '25M': 2.5e7, '50M': 5e7, '100M': 1e8, '200M': 2e8}
+
+    @staticmethod
+    def timebase_step(seconds: float) -> float:
+        """The smallest 1-2-5 timebase scale of at least this many seconds per division"""
+        decade = 10 ** math.floor(math.log10(seconds))
+        for mantissa in (1, 2, 5):
+            if mantissa * decade >= seconds * (1 - 1e-9):
+                return mantissa * decade
+        return 10 * decade
+
+    _commands = (
+        # attribute         command                         formatter           access  limits
+        ('timebase',        'TIMEBASE:SCALE',               scpi.format_real,   'rw',   ('timebase_min', 'timebase_max')),
+        ('timebase_offset', 'TIMEBASE:OFFSET',              scpi.format_real),
+        ('statistics',      'MEASURE:STATISTIC:DISPLAY',    scpi.format_onoff),
+        ('memory_depth',    'ACQUIRE:MDEPTH',               scpi.format_str),
+        ('sample_rate',     'ACQUIRE:SRATE',                scpi.format_real,   'r'),
+        ('trigger_status',  'TRIGGER:STATUS',               scpi.format_str,    'r'),
+        ('trigger_source',  'TRIGGER:EDGE:SOURCE',          scpi.format_str),
+        ('trigger_level',   'TRIGGER:EDGE:LEVEL',           scpi.format_real),
+        ('trigger_slope',   'TRIGGER:EDGE:SLOPE',           scpi.format_str),
+    )
+
+    def run(self):
+        self.resource.write('RUN')
+
+    def stop(self):
+        self.resource.write('STOP')
+
+    def single(self):
+        """
+        Arm a single acquisition
+        Waits for the scope to finish processing the command, so trigger_status no longer reports the
+        STOP left over from before and wait_for_stop() can be called straight away
+        """
+        self.resource.query('SINGLE;*OPC?')
+
+    def wait_for_stop(self, timeout: float = None, poll: float = 0.1) -> None:
+        """Wait until the scope has finished acquiring after single()"""
+        start = time.monotonic()
+        while self.trigger_status.upper() != 'STOP':
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError('Timed out waiting for the acquisition to finish')
+            time.sleep(poll)
 
     def reset_statistics(self):
         self.resource.write('MEASURE:STATISTIC:RESET')
@@ -84,6 +171,44 @@ class RigolMSO5(scpi.SCPIInstrument, instrument.Oscilloscope):
     def clear(self):
         self.resource.write('CLEAR')
 
+    def save_state(self, decode=True) -> scpi.InstrumentState:
+        """
+        Take a snapshot of the scope's settings as its binary setup blob
+        :param decode: also read the driver-level settings in a single compound query
+        """
+        blob = self.resource.query_binary_values('SYSTEM:SETUP?', datatype='B', container=bytes)
+        values = self.read_settings() if decode else {}
+        return scpi.InstrumentState(values, blob)
+
+    def restore_state(self, state: scpi.InstrumentState) -> None:
+        """Restore a snapshot taken with save_state(), using the setup blob if it has one"""
+        if state.blob is not None:
+            self.resource.write_binary_values('SYSTEM:SETUP ', state.blob, datatype='B')
+        else:
+            self.write_settings(state.values)
+
+    def watch(self, measurements, interval: float = 1.0, statistic: str = 'avg', window: float = None):
+        """
+        Start polling measurements on a background thread
+        :param measurements: Measurements to poll, either a mapping of {column name: Measurement} or a sequence,
+            in which case columns are named after each measurement's item (e.g. 'PVRMS,CHAN1')
+        :param interval: seconds between polls
+        :param statistic: which statistic to read from each measurement ('current', 'avg', 'min' or 'max')
+        :param window: if given, record the mean of each window of this many seconds instead of every poll
+        :return: A running pycicl.telemetry.Watcher. Its series attribute holds the recorded samples.
+            Timed out or garbled polls are skipped and counted in its missed attribute. If polling stops on an error,
+            subscriptions end and the Watcher's stop() raises it, so check running or call stop() on long runs
+        """
+        from pycicl.telemetry import Watcher
+
+        if not hasattr(measurements, 'keys'):
+            measurements = {m.item: m for m in measurements}
+
+        prop = getattr(RigolMSO5.Measurement, statistic)
+        queries = [prop.query_command(m) for m in measurements.values()]
+        parsers = [prop.formatter.parse] * len(queries)
+        return Watcher(self.resource, measurements.keys(), queries, parsers, interval, window).start()
+
     def measure_phase(self, channel_A, channel_B, rising_A=True, rising_B=True):
         fr_a = 'R' if rising_A else 'F'
         fr_b = 'R' if rising_B else 'F'
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod, abstractproperty
+from typing import Mapping
 from parse import Parser
+import math
 import pyvisa
 import time
 
 import pycicl.instrument as instrument
+import pycicl.transport as transport
 
 MBR = pyvisa.resources.MessageBasedResource
 
@@ -58,9 +61,9 @@ class SCPIFormatter:
         elif type(self.parser) is Parser:
             # parser is a Parser object from a formatter string, so run the parse operation
             result = self.parser.parse(raw.strip())
-            # Parser returns a Result object containing a tuple of values
+            # Parser returns a Result object containing a tuple of values, or None if the string didn't match
             # If there's only one match, we should return it on its own. otherwise, return the tuple
-            if len(result.fixed) == 0:
+            if result is None or len(result.fixed) == 0:
                 raise ValueError(f'Unable to parse value "{raw}" with parser "{self.parser}"')
             elif len(result.fixed) == 1:
                 return result.fixed[0]
@@ -78,9 +81,33 @@ format_float = SCPIFormatter('{:f}')
 
 
 
+class _AttributeMap:
+    """Mapping view of an object's attributes, so command templates like 'CHANNEL{index:d}' can be filled from it"""
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getitem__(self, key):
+        return getattr(self._obj, key)
+
+
+def eval_template(template, obj):
+    """
+    Evaluate a command template against an object
+    :param template: a callable taking obj, a format string using obj's attributes (e.g. 'CHANNEL{index:d}:SCALE'), or None
+    :param obj: the object the command is being sent for
+    """
+    if template is None:
+        return None
+    elif callable(template):
+        return template(obj)
+    else:
+        return template.format_map(_AttributeMap(obj))
+
+
 class SCPIProperty:
     def __init__(self, name, readable: bool = True, writable: bool = True, delay=None,
-                 formatter: SCPIFormatter = format_str, suffix=None, memoized=False):
+                 formatter: SCPIFormatter = format_str, suffix=None, memoized=False, limits=None):
         self._name = name
         self._readable = readable
         self._writable = writable
@@ -88,9 +115,22 @@ class SCPIProperty:
         self._suffix = suffix
         self._memoized = memoized
         self._memo_value = None
+        self._limits = limits
 
         self.formatter = formatter
 
+    @classmethod
+    def from_row(cls, name, formatter: SCPIFormatter = format_str, access: str = 'rw', limits=None, suffix=None):
+        """
+        Build a property from a row of a command table
+        :param name: command template, e.g. 'CHANNEL{index:d}:SCALE'
+        :param formatter: formatter for the value
+        :param access: 'r', 'w' or 'rw'
+        :param limits: (min, max) for written values. Either can be a number or the name of an attribute of the object
+        :param suffix: template for arguments that follow the command in both queries and writes
+        """
+        return cls(name, readable='r' in access, writable='w' in access, formatter=formatter, suffix=suffix, limits=limits)
+
     @property
     def name(self):
         return self._name
@@ -104,18 +144,49 @@ class SCPIProperty:
         return self._writable
 
     def eval_name(self, obj):
-        if callable(self._name):
-            return self._name(obj)
-        else:
-            return self._name
+        return eval_template(self._name, obj)
 
     def eval_suffix(self, obj):
-        if callable(self._suffix):
-            return self._suffix(obj)
-        else:
-            return self._suffix
+        return eval_template(self._suffix, obj)
+
+    def eval_limits(self, obj):
+        if self._limits is None:
+            return None
+        return tuple(getattr(obj, l) if isinstance(l, str) else l for l in self._limits)
+
+    def _compile(self, obj) -> tuple:
+        """Get the (query, write prefix, limits) for obj, building and caching them on first use"""
+        try:
+            return obj._compiled[self]
+        except KeyError:
+            pass
+
+        name = self.eval_name(obj)
+        query = f'{name}?'
+        prefix = name
+        if self._suffix is not None:
+            suffix = self.eval_suffix(obj)
+            query += ' ' + suffix
+            prefix += ' ' + suffix
+
+        compiled = obj._compiled[self] = (query, prefix + ' ', self.eval_limits(obj))
+        return compiled
+
+    def query_command(self, obj) -> str:
+        """The query string used to read this property from obj"""
+        return self._compile(obj)[0]
+
+    def write_command(self, obj, value) -> str:
+        """The command string used to write value to this property on obj"""
+        _, prefix, limits = self._compile(obj)
+        if limits is not None and not (limits[0] <= value <= limits[1]):
+            raise ValueError(f'{value} is outside the range [{limits[0]}, {limits[1]}] for {prefix.strip()}')
+        return prefix + self.formatter.format(value)
 
     def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
         if not self._readable:
             raise PermissionError('Reading is not allowed for this SCPI property')
 
@@ -124,10 +195,7 @@ class SCPIProperty:
             return self._memo_value
 
         # query the resource for the value and parse it
-        query = f'{self.eval_name(obj)}?'
-        if self._suffix is not None:
-            query += ' ' + self.eval_suffix(obj)
-        raw = obj.resource.query(query, delay=self._delay).strip()
+        raw = obj.resource.query(self._compile(obj)[0], delay=self._delay).strip()
         value = self.formatter.parse(raw)
 
         # if we are momoizing this property, set the cached value
@@ -140,29 +208,91 @@ class SCPIProperty:
         if not self._writable:
             raise PermissionError('Writing is not allowed for this SCPI property')
 
+        command = self.write_command(obj, value)
+
         # if we are momoizing this property, set the cached value
         if self._memoized and self._memo_value is None:
             self._memo_value = value
 
-        output = self.formatter.format(value)
-        command = f'{self.eval_name(obj)}'
-        if self._suffix is not None:
-            command += ' ' + self.eval_suffix(obj)
-        command += ' ' + output
         obj.resource.write(command)
 
 
+def diff_settings(old: Mapping, new: Mapping) -> dict:
+    """
+    Compare two sets of settings
+    :param old: settings before the change, keyed by setting path (e.g. 'ch1.scale')
+    :param new: settings after the change
+    :return: A dict of {path: (old_value, new_value)} for every setting that differs
+    """
+    changes = {}
+    for key in (*old.keys(), *(k for k in new.keys() if k not in old)):
+        a = old.get(key)
+        b = new.get(key)
+        if isinstance(a, float) and isinstance(b, float):
+            same = math.isclose(a, b, rel_tol=1e-9, abs_tol=0.0)
+        else:
+            same = a == b
+        if not same:
+            changes[key] = (a, b)
+    return changes
+
+
+class InstrumentState:
+    """
+    A snapshot of an instrument's settings.
+    values holds the decoded settings keyed by path (e.g. 'timebase', 'ch1.scale'),
+    blob holds the instrument's native setup data if it has one
+    """
+
+    def __init__(self, values: Mapping, blob: bytes = None):
+        self.values = dict(values)
+        self.blob = blob
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def diff(self, other) -> dict:
+        """
+        Compare this state against another state or mapping of settings
+        :return: A dict of {path: (this_value, other_value)} for every setting that differs
+        """
+        if isinstance(other, InstrumentState):
+            other = other.values
+        return diff_settings(self.values, other)
+
+
 class SCPIObject(ABC):
     _resource: MBR = None
+    _setting_type = SCPIProperty
+    _compiled: dict
+
+    # Declarative command table, compiled into _setting_type descriptors when the class is created.
+    # Each row is (attribute, *args) where args are passed to _setting_type.from_row()
+    _commands = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for attribute, *args in cls.__dict__.get('_commands', ()):
+            setattr(cls, attribute, cls._setting_type.from_row(*args))
 
     @property
     def resource(self):
         return self._resource
 
+    def _settings_map(self, prefix='') -> dict:
+        """Map setting paths to (owner, descriptor) for every readable and writable property of this object"""
+        settings = {}
+        for cls in reversed(type(self).__mro__):
+            for name, attr in vars(cls).items():
+                if isinstance(attr, self._setting_type) and getattr(attr, 'readable', True) and getattr(attr, 'writable', True):
+                    settings[prefix + name] = (self, attr)
+        return settings
+
 
 class SCPIChild(SCPIObject, ABC):
     def __init__(self, parent: SCPIObject):
         self._parent = parent
+        self._compiled = {}
 
     @property
     def parent(self):
@@ -177,10 +307,78 @@ class SCPIChild(SCPIObject, ABC):
 class SCPIInstrument(SCPIObject, instrument.Instrument, ABC):
     id = SCPIProperty('*IDN', writable=False)
 
+    # raw SCPI port used for tcp:// addresses that don't give one
+    default_port: int = None
+
     def __init__(self, address, rm):
+        """
+        :param address: a VISA resource address, or 'tcp://host[:port]' to talk raw SCPI over a socket without VISA
+        :param rm: a pyvisa ResourceManager. Also used as a fallback if a tcp:// connection fails
+        """
         self.address = address
-        self._resource = rm.open_resource(address)
+        self._resource = transport.open_resource(address, rm, self.default_port)
+        self._compiled = {}
+        self.profiles = {}
 
     def reset(self) -> None:
         """Reset the instrument to factory settings"""
         self._resource.write('*RST')
+
+    def _settings_map(self, prefix='') -> dict:
+        settings = super()._settings_map(prefix)
+        for channel in getattr(self, 'channels', ()):
+            settings.update(channel._settings_map(f'{prefix}ch{channel.index:d}.'))
+        return settings
+
+    def read_settings(self, keys=None) -> dict:
+        """
+        Read settings from the instrument using a single compound query
+        :param keys: setting paths to read, or None to read everything
+        :return: A dict of {path: value}
+        """
+        settings = self._settings_map()
+        if keys is not None:
+            settings = {k: settings[k] for k in keys}
+        if not settings:
+            return {}
+
+        query = ';:'.join(prop.query_command(owner) for owner, prop in settings.values())
+        raw = self.resource.query(query).strip().split(';')
+        if len(raw) != len(settings):
+            raise ValueError(f'Expected {len(settings)} responses to compound query, got {len(raw)}')
+
+        return {k: prop.formatter.parse(r.strip()) for (k, (owner, prop)), r in zip(settings.items(), raw)}
+
+    def write_settings(self, values: Mapping) -> None:
+        """
+        Write settings to the instrument using a single compound command
+        :param values: A mapping of {path: value}
+        """
+        if not values:
+            return
+        settings = self._settings_map()
+        command = ';:'.join(settings[k][1].write_command(settings[k][0], v) for k, v in values.items())
+        self.resource.write(command)
+
+    def save_state(self) -> InstrumentState:
+        """Take a snapshot of the instrument's settings"""
+        return InstrumentState(self.read_settings())
+
+    def restore_state(self, state: InstrumentState) -> None:
+        """Restore a snapshot taken with save_state()"""
+        self.write_settings(state.values)
+
+    def save_profile(self, name, keys=None) -> None:
+        """Store the instrument's current settings as a named host-side profile"""
+        self.profiles[name] = self.read_settings(keys)
+
+    def apply_profile(self, name) -> dict:
+        """
+        Apply a named profile, writing only the settings that differ from the instrument's current state
+        :param name: key into self.profiles, which maps setting paths to values
+        :return: A dict of {path: (old_value, new_value)} for every setting that was changed
+        """
+        profile = self.profiles[name]
+        changes = diff_settings(self.read_settings(profile.keys()), profile)
+        self.write_settings({k: new for k, (old, new) in changes.items()})
+        return changes
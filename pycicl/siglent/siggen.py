@@ -24,15 +24,25 @@ class SiglentProperty:
     def name(self):
         return self._name
 
+    @classmethod
+    def from_row(cls, command, name, formatter: scpi.SCPIFormatter = scpi.format_str, offset=0):
+        """Build a property from a row of a command table"""
+        return cls(command, name, formatter, offset)
+
+    def _compile(self, obj) -> tuple:
+        """Get the (command, query) for obj, building and caching them on first use"""
+        try:
+            return obj._compiled[self]
+        except KeyError:
+            command = scpi.eval_template(self._command, obj)
+            compiled = obj._compiled[self] = (command, f'{command}?')
+            return compiled
+
     def eval_command(self, obj):
-        if callable(self._command):
-            return self._command(obj)
-        else:
-            return self._command
+        return self._compile(obj)[0]
 
-    def __get__(self, obj, objtype=None):
-        # query the resource for the value and parse it
-        response = obj.resource.query(f'{self.eval_command(obj)}?').strip()
+    def parse_response(self, response: str):
+        """Extract and parse this property's value from the full response to its command"""
         values = response.split(' ')[1]
         split = values.split(',')
 
@@ -42,45 +52,89 @@ class SiglentProperty:
             d = dict(zip(split[self._offset::2], split[(self._offset + 1)::2]))
             raw = d[self._name]
 
-        value = self.formatter.parse(raw)
-        return value
-
-    def __set__(self, obj, value):
+        return self.formatter.parse(raw)
 
+    def format_argument(self, value) -> str:
+        """Format value as this property's argument(s) to its command"""
         output = self.formatter.format(value)
 
         if self._name is None:
-            command = f'{self.eval_command(obj)} {output}'
-
+            return output
         else:
-            command = f'{self.eval_command(obj)} {self._name}, {output}'
+            return f'{self._name},{output}'
 
-        obj.resource.write(command)
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        # query the resource for the value and parse it
+        response = obj.resource.query(self._compile(obj)[1]).strip()
+        return self.parse_response(response)
+
+    def __set__(self, obj, value):
+        obj.resource.write(f'{self.eval_command(obj)} {self.format_argument(value)}')
 
 
 class SiglentSDG(instrument.SigGen, scpi.SCPIInstrument):
     channel_count = 2
+    default_port = 5025
+    _setting_type = SiglentProperty
 
     class Channel(scpi.SCPIChild, instrument.SigGen.Channel):
-        @staticmethod
-        def _mk_channel(name):
-            return lambda obj: name.format(obj.index)
+        _setting_type = SiglentProperty
 
-        _format_volt = scpi.SCPIFormatter('{:f}V')
-        _format_hz = scpi.SCPIFormatter('{:f}HZ')
+        _format_volt = scpi.SCPIFormatter(parser='{:g}V', formatter='{:f}V')
+        _format_hz = scpi.SCPIFormatter(parser='{:g}HZ', formatter='{:f}HZ')
+        _format_seconds = scpi.SCPIFormatter(parser='{:g}S', formatter='{:f}S')
+        _format_degrees = scpi.SCPIFormatter(parser='{:g}', formatter='{:f}')
         _format_inverted = scpi.SCPIFormatter(parser=lambda v: v.upper() == 'INVT', formatter=lambda v: 'INVT' if v else 'NOR')
 
-        type = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'WVTP')
-        vpp = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'AMP', _format_volt)
-        frequency = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'FRQ', _format_hz)
-        phase = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'PHSE', scpi.format_float)
-        offset = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'OFST', _format_volt)
-        low = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'LLEV', _format_volt)
-        high = SiglentProperty(_mk_channel('C{:d}:BSWV'), 'HLEV', _format_volt)
-
-        output = SiglentProperty(_mk_channel('C{:d}:OUTP'), None, scpi.format_onoff, offset=0)
-        load = SiglentProperty(_mk_channel('C{:d}:OUTP'), 'LOAD', offset=1)
-        invert = SiglentProperty(_mk_channel('C{:d}:OUTP'), 'PLRT', _format_inverted, offset=1)
+        _commands = (
+            # attribute                command             parameter   formatter           offset
+            ('type',                   'C{index:d}:BSWV',  'WVTP'),
+            ('vpp',                    'C{index:d}:BSWV',  'AMP',      _format_volt),
+            ('frequency',              'C{index:d}:BSWV',  'FRQ',      _format_hz),
+            ('phase',                  'C{index:d}:BSWV',  'PHSE',     _format_degrees),
+            ('offset',                 'C{index:d}:BSWV',  'OFST',     _format_volt),
+            ('low',                    'C{index:d}:BSWV',  'LLEV',     _format_volt),
+            ('high',                   'C{index:d}:BSWV',  'HLEV',     _format_volt),
+
+            ('output',                 'C{index:d}:OUTP',  None,       scpi.format_onoff,  0),
+            ('load',                   'C{index:d}:OUTP',  'LOAD',     scpi.format_str,    1),
+            ('invert',                 'C{index:d}:OUTP',  'PLRT',     _format_inverted,   1),
+
+            ('sweep',                  'C{index:d}:SWWV',  'STATE',    scpi.format_onoff),
+            ('sweep_time',             'C{index:d}:SWWV',  'TIME',     _format_seconds),
+            ('sweep_start',            'C{index:d}:SWWV',  'START',    _format_hz),
+            ('sweep_stop',             'C{index:d}:SWWV',  'STOP',     _format_hz),
+            ('sweep_spacing',          'C{index:d}:SWWV',  'SWMD'),  # LINE or LOG
+            ('sweep_direction',        'C{index:d}:SWWV',  'DIR'),  # UP or DOWN
+            ('sweep_trigger',          'C{index:d}:SWWV',  'TRSR'),  # INT, EXT or MAN
+            ('sweep_trigger_output',   'C{index:d}:SWWV',  'TRMD',     scpi.format_onoff),
+        )
+
+        def configure_sweep(self, start: float, stop: float, time: float, spacing: str = 'LOG',
+                            trigger: str = 'INT', direction: str = 'UP', trigger_output: bool = True) -> None:
+            """
+            Configure and enable a hardware frequency sweep in a single command
+            :param start: start frequency in Hz
+            :param stop: stop frequency in Hz
+            :param time: duration of one sweep in seconds
+            :param spacing: 'LINE' or 'LOG'
+            :param trigger: sweep trigger source, 'INT', 'EXT' or 'MAN'
+            :param direction: 'UP' or 'DOWN'
+            :param trigger_output: output a trigger edge at the start of each sweep
+            """
+            cls = type(self)
+            settings = ((cls.sweep_start, start), (cls.sweep_stop, stop), (cls.sweep_time, time),
+                        (cls.sweep_spacing, spacing), (cls.sweep_direction, direction), (cls.sweep_trigger, trigger),
+                        (cls.sweep_trigger_output, trigger_output), (cls.sweep, True))
+            arguments = ",".join(prop.format_argument(value) for prop, value in settings)
+            self.resource.write(f'{cls.sweep.eval_command(self)} {arguments}')
+
+        def trigger_sweep(self) -> None:
+            """Start a sweep when the sweep trigger source is 'MAN'"""
+            self.resource.write(f'{type(self).sweep.eval_command(self)} MTRIG')
 
         def __init__(self, parent: SiglentSDG, index: int):
             instrument.SigGen.Channel.__init__(self, parent, index)
@@ -88,4 +142,49 @@ class SiglentSDG(instrument.SigGen, scpi.SCPIInstrument):
 
     def __init__(self, address, rm):
         instrument.SigGen.__init__(self)
-        scpi.SCPIInstrument.__init__(self, address, rm)
\ No newline at end of file
+        scpi.SCPIInstrument.__init__(self, address, rm)
+
+    def read_settings(self, keys=None) -> dict:
+        """
+        Read settings from the generator.
+        The SDG reports every parameter of a command (e.g. C1:BSWV) in one response,
+        so each command is only queried once no matter how many settings it holds
+        :param keys: setting paths to read, or None to read everything
+        :return: A dict of {path: value}. Settings the generator doesn't report in its current mode
+            (e.g. FRQ for a DC waveform) are left out
+        """
+        settings = self._settings_map()
+        if keys is not None:
+            settings = {k: settings[k] for k in keys}
+
+        responses = {}
+        values = {}
+        for key, (owner, prop) in settings.items():
+            command = prop.eval_command(owner)
+            if command not in responses:
+                responses[command] = self.resource.query(f'{command}?').strip()
+            try:
+                values[key] = prop.parse_response(responses[command])
+            except (KeyError, IndexError):
+                # parameter isn't part of the response in the generator's current mode
+                continue
+        return values
+
+    def write_settings(self, values) -> None:
+        """
+        Write settings to the generator, combining all parameters of each command into a single write
+        :param values: A mapping of {path: value}
+        """
+        settings = self._settings_map()
+        arguments = {}
+        for key, value in values.items():
+            owner, prop = settings[key]
+            args = arguments.setdefault(prop.eval_command(owner), [])
+            if prop.name is None:
+                # positional arguments have to come before named ones
+                args.insert(0, prop.format_argument(value))
+            else:
+                args.append(prop.format_argument(value))
+
+        for command, args in arguments.items():
+            self.resource.write(f'{command} {",".join(args)}')
\ No newline at end of file
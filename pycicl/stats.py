@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import math
+from statistics import NormalDist
+
+
+def t_cdf(t: float, dof: int) -> float:
+    """
+    Cumulative distribution function of Student's t distribution for integer degrees of freedom,
+    using the finite series in Abramowitz & Stegun 26.7.3 and 26.7.4
+    :param t: value
+    :param dof: degrees of freedom
+    :return: P(T <= t)
+    """
+    theta = math.atan2(t, math.sqrt(dof))
+    c2 = math.cos(theta) ** 2
+
+    if dof % 2:
+        term = total = 0.0
+        if dof > 1:
+            term = total = math.cos(theta)
+            for k in range(3, dof - 1, 2):
+                term *= c2 * (k - 1) / k
+                total += term
+        a = 2 / math.pi * (theta + math.sin(theta) * total)
+    else:
+        term = total = 1.0
+        for k in range(2, dof - 1, 2):
+            term *= c2 * (k - 1) / k
+            total += term
+        a = math.sin(theta) * total
+
+    return 0.5 + a / 2
+
+
+def t_quantile(p: float, dof: int) -> float:
+    """
+    Quantile of Student's t distribution
+    Closed form for one and two degrees of freedom. Up to 30 degrees of freedom, the Cornish-Fisher expansion
+    around the normal quantile is refined by Newton's method on t_cdf() to full precision. Above that the expansion
+    is used on its own; it is within 0.003% of the true quantile for p up to 0.9995, which avoids depending on scipy
+    :param p: cumulative probability, e.g. 0.975 for a two-sided 95% interval
+    :param dof: degrees of freedom
+    :return: t such that P(T <= t) = p
+    """
+    if dof < 1:
+        raise ValueError('t quantile needs at least one degree of freedom')
+    elif dof == 1:
+        return math.tan(math.pi * (p - 0.5))
+    elif dof == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    t = z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3
+    if dof > 30:
+        return t
+
+    # the expansion underestimates the tails at low dof, so refine it against the exact cdf
+    log_norm = math.lgamma((dof + 1) / 2) - math.lgamma(dof / 2) - 0.5 * math.log(dof * math.pi)
+    for _ in range(50):
+        pdf = math.exp(log_norm - (dof + 1) / 2 * math.log1p(t * t / dof))
+        step = (t_cdf(t, dof) - p) / pdf
+        t -= step
+        if abs(step) <= 1e-12 * max(abs(t), 1.0):
+            break
+    return t
+
+
+class RunningStats:
+    """
+    Running mean and variance of several named columns, using Welford's algorithm.
+    Memory use is constant no matter how many samples are added
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.count = 0
+        self._mean = [0.0] * len(self.columns)
+        self._m2 = [0.0] * len(self.columns)
+
+    def update(self, row) -> None:
+        """
+        Add a sample
+        :param row: a sequence of values in the same order as columns, or a mapping of column name to value
+        """
+        if hasattr(row, 'keys'):
+            row = [row[c] for c in self.columns]
+        if len(row) != len(self.columns):
+            raise ValueError(f'Expected {len(self.columns)} values, got {len(row)}')
+
+        self.count += 1
+        for i, x in enumerate(row):
+            delta = x - self._mean[i]
+            self._mean[i] += delta / self.count
+            self._m2[i] += delta * (x - self._mean[i])
+
+    def _index(self, column) -> int:
+        return self.columns.index(column)
+
+    def mean(self, column) -> float:
+        return self._mean[self._index(column)]
+
+    def variance(self, column) -> float:
+        """Sample (n-1) variance of a column, or nan with fewer than two samples"""
+        if self.count < 2:
+            return math.nan
+        return self._m2[self._index(column)] / (self.count - 1)
+
+    def std(self, column) -> float:
+        return math.sqrt(self.variance(column))
+
+    def sem(self, column) -> float:
+        """Standard error of the mean of a column"""
+        return self.std(column) / math.sqrt(self.count)
+
+    def half_width(self, column, confidence: float = 0.95) -> float:
+        """Half-width of the two-sided confidence interval on the mean of a column"""
+        if self.count < 2:
+            return math.inf
+        return t_quantile(0.5 + confidence / 2, self.count - 1) * self.sem(column)
+
+    def converged(self, columns=None, precision: float = None, rel_precision: float = None,
+                  confidence: float = 0.95, min_count: int = 2) -> bool:
+        """
+        Check whether the mean of every column is known to the requested precision
+        :param columns: columns to check, or None to check all of them
+        :param precision: maximum absolute confidence interval half-width
+        :param rel_precision: maximum half-width relative to the magnitude of the mean
+        :param confidence: confidence level of the interval
+        :param min_count: never report convergence with fewer samples than this
+        :return: True once every column meets every given precision
+        """
+        if self.count < max(min_count, 2):
+            return False
+
+        for column in (self.columns if columns is None else columns):
+            hw = self.half_width(column, confidence)
+            if precision is not None and hw > precision:
+                return False
+            if rel_precision is not None and hw > rel_precision * abs(self.mean(column)):
+                return False
+        return True
+
+    def summary(self, confidence: float = 0.95) -> dict:
+        """A dict of {column: (mean, std, half_width)}"""
+        return {c: (self.mean(c), self.std(c), self.half_width(c, confidence)) for c in self.columns}
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import numpy as np
+
+from pycicl.waveform import Waveform
+
+
+def sweep_frequency(t, start: float, stop: float, sweep_time: float, spacing: str = 'LOG'):
+    """
+    Instantaneous frequency of a generator sweep
+    :param t: time since the start of the sweep in seconds
+    :param start: start frequency in Hz
+    :param stop: stop frequency in Hz
+    :param sweep_time: duration of the sweep in seconds
+    :param spacing: 'LINE' or 'LOG'
+    """
+    x = np.asarray(t) / sweep_time
+    if spacing.upper().startswith('LIN'):
+        return start + (stop - start) * x
+    else:
+        return start * (stop / start) ** x
+
+
+def sweep_phase(t, start: float, stop: float, sweep_time: float, spacing: str = 'LOG'):
+    """Phase in radians of a generator sweep, the integral of sweep_frequency() from the start of the sweep"""
+    t = np.asarray(t)
+    if spacing.upper().startswith('LIN'):
+        return 2 * np.pi * (start * t + (stop - start) * t ** 2 / (2 * sweep_time))
+    else:
+        k = np.log(stop / start) / sweep_time
+        return 2 * np.pi * start * np.expm1(k * t) / k
+
+
+def sweep_response(vin: Waveform, vout: Waveform, start: float, stop: float, sweep_time: float,
+                   spacing: str = 'LOG', points: int = 100, t0: float = 0.0, chunk_size: int = 1 << 20):
+    """
+    Compute a frequency response from one captured generator sweep.
+    The sweep is split into equal-time segments, and each segment of both waveforms is demodulated against
+    the sweep's own phase with a Hann window. Records are processed in chunks, so they can be memmapped
+    :param vin: waveform at the input of the device under test
+    :param vout: waveform at the output of the device under test, sampled at the same times as vin
+    :param start: start frequency of the sweep in Hz
+    :param stop: stop frequency of the sweep in Hz
+    :param sweep_time: duration of the sweep in seconds
+    :param spacing: 'LINE' or 'LOG'
+    :param points: number of frequency points to return
+    :param t0: time of the start of the sweep on the waveforms' time axis, normally 0 if triggered by the generator
+    :param chunk_size: samples to process at a time
+    :return: (frequency, vin, vout, gain) arrays for each segment that was captured. vin and vout are complex
+        peak amplitudes, and gain is their complex ratio
+    """
+    if len(vin) != len(vout):
+        raise ValueError('Input and output waveforms must be the same length')
+    if vin.sample_rate < 2 * max(start, stop):
+        raise ValueError(f'Sample rate {vin.sample_rate:g} Sa/s is too low for a sweep up to {max(start, stop):g} Hz')
+
+    segment_time = sweep_time / points
+    sums_in = np.zeros(points, dtype=np.complex128)
+    sums_out = np.zeros(points, dtype=np.complex128)
+    weights = np.zeros(points)
+
+    for first in range(0, len(vin), chunk_size):
+        last = min(first + chunk_size, len(vin))
+        t = vin.time(first, last) - t0
+
+        # only use samples taken during the sweep
+        valid = (t >= 0) & (t < sweep_time)
+        if not np.any(valid):
+            continue
+        t = t[valid]
+
+        segment = np.minimum((t / segment_time).astype(np.int64), points - 1)
+        position = t / segment_time - segment
+        window = np.sin(np.pi * position) ** 2
+        reference = window * np.exp(-1j * sweep_phase(t, start, stop, sweep_time, spacing))
+
+        x_in = vin.voltage(first, last)[valid]
+        x_out = vout.voltage(first, last)[valid]
+        sums_in += np.bincount(segment, (x_in * reference).real, points) + 1j * np.bincount(segment, (x_in * reference).imag, points)
+        sums_out += np.bincount(segment, (x_out * reference).real, points) + 1j * np.bincount(segment, (x_out * reference).imag, points)
+        weights += np.bincount(segment, window, points)
+
+    captured = weights > 0
+    frequency = sweep_frequency((np.arange(points) + 0.5) * segment_time, start, stop, sweep_time, spacing)[captured]
+    amplitude_in = 2 * sums_in[captured] / weights[captured]
+    amplitude_out = 2 * sums_out[captured] / weights[captured]
+    return frequency, amplitude_in, amplitude_out, amplitude_out / amplitude_in
+
+
+def capture_sweep_bode(generator, scope, input_channel: int, output_channel: int, start: float, stop: float,
+                       sweep_time: float, trigger_source: str, spacing: str = 'LOG', points: int = 100,
+                       trigger_level: float = 1.0, timeout: float = None):
+    """
+    Measure a frequency response with a single hardware generator sweep.
+    The generator's sweep trigger output must be connected to the scope's trigger_source.
+    The vertical scale of both channels is left as it is, and must fit the signal at every frequency in the sweep
+    :param generator: the SiglentSDG channel driving the device under test
+    :param scope: the RigolMSO5 capturing the sweep
+    :param input_channel: scope channel number measuring the input of the device under test
+    :param output_channel: scope channel number measuring the output of the device under test
+    :param start: start frequency in Hz
+    :param stop: stop frequency in Hz
+    :param sweep_time: duration of the sweep in seconds. The scope's timebase is set to the next 1-2-5 step that
+        covers it, with enough memory depth to sample at more than twice the stop frequency
+    :param trigger_source: the scope trigger source wired to the generator's trigger output, e.g. 'CHAN4'
+    :param spacing: 'LINE' or 'LOG'
+    :param points: number of frequency points to return
+    :param trigger_level: trigger level in volts for the generator's trigger output
+    :param timeout: seconds to wait for the capture, by default twice the sweep time plus 10s
+    :return: see sweep_response()
+    :raises ValueError: if the scope can't capture the sweep fast enough, or either channel clipped
+    """
+    # the capture has to cover the whole sweep on a 1-2-5 timebase, at more than twice the stop frequency
+    timebase = scope.timebase_step(sweep_time / scope.timebase_divisions)
+    minimum_points = 2 * stop * timebase * scope.timebase_divisions
+    depth = next((d for d, n in scope.memory_depths.items() if n > minimum_points), None)
+    if depth is None:
+        raise ValueError(f'A {sweep_time:g}s sweep up to {stop:g}Hz needs more than {minimum_points:.3g} points of memory')
+
+    scope.write_settings({
+        'trigger_source': trigger_source,
+        'trigger_level': trigger_level,
+        'trigger_slope': 'POSITIVE',
+        'memory_depth': depth,
+        'timebase': timebase,
+    })
+    timebase = scope.timebase
+    if timebase * scope.timebase_divisions < sweep_time:
+        raise ValueError(f'Scope timebase of {timebase:g}s/div is too short for a {sweep_time:g}s sweep')
+    sample_rate = scope.sample_rate
+    if sample_rate <= 2 * stop:
+        raise ValueError(f'Scope sample rate of {sample_rate:g}Sa/s is too low for a sweep up to {stop:g}Hz')
+    scope.timebase_offset = timebase * scope.timebase_divisions / 2  # put the trigger at the left edge of the screen
+
+    generator.configure_sweep(start, stop, sweep_time, spacing, trigger='INT', trigger_output=True)
+    try:
+        scope.single()
+        scope.wait_for_stop(2 * sweep_time + 10 if timeout is None else timeout)
+
+        vin = scope.channels[input_channel - 1].read_waveform()
+        vout = scope.channels[output_channel - 1].read_waveform()
+    finally:
+        generator.sweep = False
+
+    # a clipped capture demodulates to a wrong gain without any other sign of trouble
+    for name, waveform in (('input', vin), ('output', vout)):
+        codes = np.asarray(waveform.codes)
+        if codes.min() == 0 or codes.max() == 255:
+            raise ValueError(f'The {name} channel clipped during the sweep, increase its scale')
+
+    return sweep_response(vin, vout, start, stop, sweep_time, spacing, points)
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, Sequence
+
+import numpy as np
+import pyvisa
+
+
+class TimeSeries:
+    """
+    A growable table of timestamped samples backed by a NumPy array.
+    Column 0 of the underlying array is the timestamp, followed by one column per value.
+    Storage doubles when full, so appending is amortized O(1)
+    """
+
+    def __init__(self, columns: Sequence[str], capacity: int = 1024):
+        self.columns = tuple(columns)
+        self._data = np.empty((max(capacity, 1), len(self.columns) + 1))
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, t: float, values: Sequence[float]) -> None:
+        with self._lock:
+            if self._size == len(self._data):
+                grown = np.empty((2 * len(self._data), self._data.shape[1]))
+                grown[:self._size] = self._data
+                self._data = grown
+            self._data[self._size, 0] = t
+            self._data[self._size, 1:] = values
+            self._size += 1
+
+    def array(self) -> np.ndarray:
+        """A copy of the samples as an (n, 1 + len(columns)) array, timestamps first"""
+        with self._lock:
+            return self._data[:self._size].copy()
+
+    @property
+    def time(self) -> np.ndarray:
+        with self._lock:
+            return self._data[:self._size, 0].copy()
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        i = self.columns.index(column) + 1
+        with self._lock:
+            return self._data[:self._size, i].copy()
+
+    def aggregate(self, period: float, how: str = 'mean') -> TimeSeries:
+        """
+        Downsample into fixed windows
+        :param period: window length in seconds, aligned to the first sample
+        :param how: 'mean', 'min' or 'max'
+        :return: A new TimeSeries with one row per non-empty window, timestamped at the start of the window
+        """
+        data = self.array()
+        result = TimeSeries(self.columns, capacity=1)
+        if len(data) == 0:
+            return result
+
+        bins = np.floor((data[:, 0] - data[0, 0]) / period).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+        values = data[:, 1:]
+
+        if how == 'mean':
+            reduced = np.add.reduceat(values, starts, axis=0) / np.diff(np.append(starts, len(data)))[:, None]
+        elif how == 'min':
+            reduced = np.minimum.reduceat(values, starts, axis=0)
+        elif how == 'max':
+            reduced = np.maximum.reduceat(values, starts, axis=0)
+        else:
+            raise ValueError(f'Unknown aggregation "{how}"')
+
+        result._data = np.column_stack((data[0, 0] + bins[starts] * period, reduced))
+        result._size = len(starts)
+        return result
+
+
+class Subscription:
+    """
+    A stream of (timestamp, {column: value}) samples from a Watcher.
+    Samples are buffered in a bounded queue; if the consumer falls behind the oldest samples are dropped
+    so the poller never blocks
+    """
+
+    def __init__(self, watcher: Watcher, maxsize: int):
+        self._watcher = watcher
+        self._queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def _push(self, sample) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(sample)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None):
+        """Wait for the next sample, or return None once the watcher has stopped"""
+        return self._queue.get(timeout=timeout)
+
+    def __iter__(self):
+        while True:
+            sample = self._queue.get()
+            if sample is None:
+                return
+            yield sample
+
+    def close(self) -> None:
+        self._watcher.unsubscribe(self)
+        self._push(None)
+
+
+class Watcher:
+    """
+    Polls a set of scalar queries on a background thread and records the results in a TimeSeries.
+    Every poll is sent as a single compound query, so each sample costs one round trip.
+    A poll that times out or gets a garbled reply is skipped and counted in missed. After max_consecutive_errors
+    failed polls in a row, or any other exception, polling stops, the exception is kept in error and stop() raises it.
+    The instrument's resource should not be used by other threads while a Watcher is running
+    """
+
+    # exceptions that only cost the poll they happen in
+    transient_errors = (OSError, ValueError, pyvisa.errors.VisaIOError)
+    max_consecutive_errors = 10
+
+    def __init__(self, resource, columns: Sequence[str], queries: Sequence[str], parsers: Sequence[Callable],
+                 interval: float, window: float = None, capacity: int = 1024):
+        """
+        :param resource: the VISA resource to query
+        :param columns: a name for each query
+        :param queries: the query strings to poll
+        :param parsers: a function to parse each query's response
+        :param interval: seconds between polls
+        :param window: if given, record the mean of each window of this many seconds instead of every poll.
+            A window ends with the last poll before its start + window, and the window in progress is recorded on stop
+        :param capacity: initial capacity of the TimeSeries
+        """
+        self.resource = resource
+        self.columns = tuple(columns)
+        self.interval = interval
+        self.window = window
+        self.series = TimeSeries(self.columns, capacity)
+        self.error = None
+        self.missed = 0
+
+        self._query = ';:'.join(queries)
+        self._parsers = tuple(parsers)
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='pycicl-watcher', daemon=True)
+
+    def poll(self) -> tuple:
+        """Query every value once, returning (timestamp, values)"""
+        raw = self.resource.query(self._query).strip().split(';')
+        t = time.time()
+        if len(raw) != len(self._parsers):
+            raise ValueError(f'Expected {len(self._parsers)} responses to compound query, got {len(raw)}')
+        return t, [parse(r.strip()) for parse, r in zip(self._parsers, raw)]
+
+    def _publish(self, t, values) -> None:
+        self.series.append(t, values)
+        sample = (t, dict(zip(self.columns, values)))
+        with self._subscribers_lock:
+            subscribers = tuple(self._subscribers)
+        for subscriber in subscribers:
+            subscriber._push(sample)
+
+    def _run(self) -> None:
+        next_poll = time.monotonic()
+        window_start = None
+        window_values = []
+        consecutive_errors = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    t, values = self.poll()
+                except self.transient_errors:
+                    self.missed += 1
+                    consecutive_errors += 1
+                    if consecutive_errors >= self.max_consecutive_errors:
+                        raise
+                else:
+                    consecutive_errors = 0
+                    if self.window is None:
+                        self._publish(t, values)
+                    else:
+                        if window_start is None:
+                            window_start = t
+                        window_values.append(values)
+                        # close the window on the last poll that falls inside it
+                        if t + self.interval >= window_start + self.window:
+                            self._publish(window_start, np.mean(window_values, axis=0))
+                            window_start = None
+                            window_values = []
+
+                # poll on a fixed cadence, skipping polls we have already missed
+                next_poll += self.interval
+                now = time.monotonic()
+                if next_poll < now:
+                    next_poll = now
+                self._stop.wait(next_poll - now)
+
+            if window_values:
+                # publish the partial window in progress when stopped
+                self._publish(window_start, np.mean(window_values, axis=0))
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._subscribers_lock:
+                subscribers, self._subscribers = self._subscribers, []
+                self._finished = True
+            for subscriber in subscribers:
+                subscriber._push(None)
+
+    def start(self) -> Watcher:
+        self._thread.start()
+        return self
+
+    def _join(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def stop(self) -> None:
+        """Stop polling and wait for the poll in progress to finish, raising the error that stopped it if there was one"""
+        self._join()
+        if self.error is not None:
+            raise self.error
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def subscribe(self, callback: Callable = None, maxsize: int = 1024) -> Subscription:
+        """
+        Subscribe to new samples
+        :param callback: if given, called with (timestamp, {column: value}) for each sample on its own thread
+        :param maxsize: number of samples to buffer before dropping the oldest
+        :return: A Subscription, which can be iterated over to receive samples. It ends when the watcher stops,
+            or straight away if it already has
+        """
+        subscription = Subscription(self, maxsize)
+        with self._subscribers_lock:
+            if self._finished:
+                # the poller has already exited, so the subscription ends immediately
+                subscription._push(None)
+            else:
+                self._subscribers.append(subscription)
+
+        if callback is not None:
+            def dispatch():
+                for sample in subscription:
+                    callback(*sample)
+            threading.Thread(target=dispatch, name='pycicl-watcher-callback', daemon=True).start()
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._subscribers_lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # don't hide an exception from the with block behind one from the poller
+        if exc_type is None:
+            self.stop()
+        else:
+            self._join()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import socket
+import struct
+import time
+from urllib.parse import urlsplit
+
+
+class SocketResource:
+    """
+    A raw SCPI-over-TCP connection, used in place of a pyvisa MessageBasedResource.
+    Implements the subset of the pyvisa resource API used by pycicl, without the VISA stack in between
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, host: str, port: int, timeout: float = 2000, read_termination: str = '\n',
+                 write_termination: str = '\n', receive_buffer: int = 4 << 20, encoding: str = 'ascii'):
+        """
+        :param host: hostname or IP address of the instrument
+        :param port: TCP port of the instrument's raw SCPI server
+        :param timeout: I/O timeout in milliseconds, as with pyvisa
+        :param read_termination: terminator at the end of each response
+        :param write_termination: terminator appended to each command
+        :param receive_buffer: requested size of the kernel receive buffer in bytes
+        :param encoding: encoding used for commands and responses
+        """
+        self.host = host
+        self.port = port
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.encoding = encoding
+
+        self._socket = socket.create_connection((host, port), timeout=timeout / 1000)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        self._timeout = timeout
+
+        # bytes received but not yet consumed, and a reusable chunk to receive into
+        self._pending = bytearray()
+        self._chunk = bytearray(self.chunk_size)
+
+    @property
+    def timeout(self) -> float:
+        """I/O timeout in milliseconds"""
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value: float):
+        self._timeout = value
+        self._socket.settimeout(None if value is None else value / 1000)
+
+    def close(self) -> None:
+        self._socket.close()
+
+    def _receive(self) -> None:
+        n = self._socket.recv_into(self._chunk)
+        if n == 0:
+            raise ConnectionError(f'Connection to {self.host}:{self.port} closed by instrument')
+        self._pending += memoryview(self._chunk)[:n]
+
+    def _receive_exactly(self, buffer: memoryview) -> None:
+        """Fill buffer completely, starting from any bytes already received"""
+        n = min(len(self._pending), len(buffer))
+        buffer[:n] = self._pending[:n]
+        del self._pending[:n]
+        while n < len(buffer):
+            received = self._socket.recv_into(buffer[n:])
+            if received == 0:
+                raise ConnectionError(f'Connection to {self.host}:{self.port} closed by instrument')
+            n += received
+
+    def write_raw(self, message: bytes) -> int:
+        self._socket.sendall(message)
+        return len(message)
+
+    def write(self, message: str) -> int:
+        return self.write_raw((message + self.write_termination).encode(self.encoding))
+
+    def read_raw(self) -> bytes:
+        """Read up to and including the next read terminator"""
+        terminator = self.read_termination.encode(self.encoding)
+        start = 0
+        while True:
+            end = self._pending.find(terminator, start)
+            if end >= 0:
+                end += len(terminator)
+                data = bytes(self._pending[:end])
+                del self._pending[:end]
+                return data
+            start = max(len(self._pending) - len(terminator) + 1, 0)
+            self._receive()
+
+    def read(self) -> str:
+        message = self.read_raw().decode(self.encoding)
+        if message.endswith(self.read_termination):
+            message = message[:-len(self.read_termination)]
+        return message
+
+    def query(self, message: str, delay: float = None) -> str:
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read()
+
+    def _read_block_header(self) -> int:
+        """Read an IEEE 488.2 definite length block header and return the length of the data that follows"""
+        while len(self._pending) < 2:
+            self._receive()
+        start = self._pending.find(b'#')
+        while start < 0 or len(self._pending) < start + 2:
+            self._receive()
+            start = self._pending.find(b'#')
+
+        digits = int(chr(self._pending[start + 1]))
+        if digits == 0:
+            raise ValueError('Indefinite length binary blocks are not supported')
+        while len(self._pending) < start + 2 + digits:
+            self._receive()
+
+        length = int(self._pending[start + 2:start + 2 + digits])
+        del self._pending[:start + 2 + digits]
+        return length
+
+    def _discard_termination(self) -> None:
+        terminator = self.read_termination.encode(self.encoding)
+        while len(self._pending) < len(terminator):
+            self._receive()
+        if self._pending.startswith(terminator):
+            del self._pending[:len(terminator)]
+
+    def read_block_into(self, buffer) -> int:
+        """
+        Read an IEEE 488.2 binary block into a preallocated buffer
+        :param buffer: any writable buffer (bytearray, numpy array, ...) at least as large as the block
+        :return: The number of bytes written into buffer
+        """
+        view = memoryview(buffer).cast('B')
+        length = self._read_block_header()
+        if length > len(view):
+            raise ValueError(f'Block of {length} bytes does not fit in a buffer of {len(view)} bytes')
+        self._receive_exactly(view[:length])
+        self._discard_termination()
+        return length
+
+    def query_block_into(self, message: str, buffer, delay: float = None) -> int:
+        """Send a query and read its binary block response into a preallocated buffer"""
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read_block_into(buffer)
+
+    def read_binary_values(self, datatype: str = 'f', is_big_endian: bool = False, container=list):
+        length = self._read_block_header()
+        block = bytearray(length)
+        self._receive_exactly(memoryview(block))
+        self._discard_termination()
+
+        if container in (bytes, bytearray):
+            return container(block)
+        elif getattr(container, '__module__', None) == 'numpy':
+            import numpy as np
+            return np.frombuffer(block, dtype=np.dtype(datatype).newbyteorder('>' if is_big_endian else '<'))
+
+        count = length // struct.calcsize(datatype)
+        return container(struct.unpack(f'{">" if is_big_endian else "<"}{count}{datatype}', block))
+
+    def query_binary_values(self, message: str, datatype: str = 'f', is_big_endian: bool = False,
+                            container=list, delay: float = None):
+        self.write(message)
+        if delay:
+            time.sleep(delay)
+        return self.read_binary_values(datatype, is_big_endian, container)
+
+    def write_binary_values(self, message: str, values, datatype: str = 'f', is_big_endian: bool = False) -> int:
+        if isinstance(values, (bytes, bytearray, memoryview)):
+            data = bytes(values)
+        else:
+            data = struct.pack(f'{">" if is_big_endian else "<"}{len(values)}{datatype}', *values)
+        length = str(len(data))
+        header = f'#{len(length)}{length}'.encode(self.encoding)
+        return self.write_raw(message.encode(self.encoding) + header + data + self.write_termination.encode(self.encoding))
+
+
+def open_resource(address: str, rm=None, default_port: int = None, **kwargs):
+    """
+    Open an instrument connection, choosing the transport from the address scheme.
+    'tcp://host[:port]' addresses use a SocketResource, falling back to pyvisa's TCPIP SOCKET resource
+    if the connection fails and a resource manager was given. All other addresses are opened with pyvisa
+    :param address: the instrument address
+    :param rm: a pyvisa ResourceManager
+    :param default_port: port to use if a tcp:// address does not give one
+    :param kwargs: extra arguments for SocketResource
+    """
+    if not address.lower().startswith('tcp://'):
+        return rm.open_resource(address)
+
+    url = urlsplit(address)
+    port = url.port or default_port
+    if port is None:
+        raise ValueError(f'No port given in address "{address}"')
+
+    try:
+        return SocketResource(url.hostname, port, **kwargs)
+    except OSError:
+        if rm is None:
+            raise
+        resource = rm.open_resource(f'TCPIP::{url.hostname}::{port:d}::SOCKET')
+        resource.read_termination = kwargs.get('read_termination', '\n')
+        resource.write_termination = kwargs.get('write_termination', '\n')
+        return resource
+
+
+def measure_latency(resource, query: str = '*IDN?', count: int = 100) -> float:
+    """Mean round-trip time in seconds of a short query"""
+    resource.query(query)
+    start = time.perf_counter()
+    for _ in range(count):
+        resource.query(query)
+    return (time.perf_counter() - start) / count
+
+
+def measure_throughput(resource, query: str, count: int = 10) -> float:
+    """Mean throughput in bytes per second of a query returning a binary block, such as a waveform read"""
+    resource.query_binary_values(query, datatype='B', container=bytes)
+    total = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        total += len(resource.query_binary_values(query, datatype='B', container=bytes))
+    return total / (time.perf_counter() - start)
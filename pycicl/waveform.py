@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class Waveform:
+    """
+    A captured waveform, stored as raw ADC codes along with the scaling needed to convert them to volts.
+    codes can be any array-like, including a numpy memmap, so long records don't need to fit in memory
+    """
+
+    def __init__(self, codes, xincrement: float, xorigin: float = 0.0, yincrement: float = 1.0, yoffset: float = 0.0):
+        """
+        :param codes: raw sample values
+        :param xincrement: seconds between samples
+        :param xorigin: time of the first sample, relative to the trigger
+        :param yincrement: volts per code
+        :param yoffset: code corresponding to 0V
+        """
+        self.codes = codes
+        self.xincrement = xincrement
+        self.xorigin = xorigin
+        self.yincrement = yincrement
+        self.yoffset = yoffset
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def sample_rate(self) -> float:
+        return 1 / self.xincrement
+
+    def to_volts(self, codes) -> np.ndarray:
+        """Convert raw codes, e.g. a slice of this waveform's codes, to volts"""
+        return (np.asarray(codes, dtype=np.float64) - self.yoffset) * self.yincrement
+
+    def time(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Sample times in seconds relative to the trigger"""
+        stop = len(self) if stop is None else stop
+        return self.xorigin + np.arange(start, stop) * self.xincrement
+
+    def voltage(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Sample values in volts"""
+        return self.to_volts(self.codes[start:stop])
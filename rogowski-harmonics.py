@@ -7,6 +7,7 @@ import pandas as pd
 import pyvisa
 from pycicl.rigol.oscilloscope import RigolMSO5
 from pycicl.siglent.siggen import SiglentSDG
+from pycicl.planner import plan, log_step_cost, range_cost
 
 @click.command()
 @click.option('--siggen_id', '-g', prompt='DS1022 VISA ID', help='VISA ID of the DS1022 signal generator')
@@ -15,7 +16,8 @@ from pycicl.siglent.siggen import SiglentSDG
 @click.option('--fundamental', '-f', default=13.56e6, help='Starting frequency')
 @click.option('--count', '-c', default=20, help='Harmonic steps')
 @click.option('--load', '-l', default=50, type=float, help='Current load')
-def run(siggen_id, scope_id, output, fundamental, count, load):
+@click.option('--monotonic/--planned', default=False, help='Visit frequencies in ascending order instead of the cheapest order')
+def run(siggen_id, scope_id, output, fundamental, count, load, monotonic):
     rm = pyvisa.ResourceManager()
 
     siggen = SiglentSDG(siggen_id, rm)
@@ -54,9 +56,15 @@ def run(siggen_id, scope_id, output, fundamental, count, load):
         else:
             return f'{freq/1e9:.3f} Ghz'
 
-    with click.progressbar(frequencies, label='Performing frequency sweep', item_show_func=format_freq) as bar:
-        for f in bar:
-            vin_target = 3.535 if f < 20e6 else 1.767
+    # order the sweep to minimize generator settling and re-ranging when vin_target changes
+    points = [{'frequency': f, 'vin_target': 3.535 if f < 20e6 else 1.767} for f in frequencies]
+    costs = {'frequency': log_step_cost(0.5, fixed=0.1), 'vin_target': range_cost([2.0], 4.0)}
+    points = plan(points, costs, monotonic='frequency' if monotonic else None)
+
+    with click.progressbar(points, label='Performing frequency sweep', item_show_func=lambda p: format_freq(p and p['frequency'])) as bar:
+        for point in bar:
+            f = point['frequency']
+            vin_target = point['vin_target']
 
             pvrms1 = scope.ch1.pvrms
             pvrms2 = scope.ch2.pvrms
@@ -94,6 +102,7 @@ def run(siggen_id, scope_id, output, fundamental, count, load):
             gain_v = vout_v / vin
             data.append((f, vin_target, vin, vout_i, vout_v, gain_i, gain_v))
 
+    data.sort()
     print('Current harmonics:')
     for row in data:
         print(row[5])
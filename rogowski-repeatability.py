@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import click
+import csv
 import time
 import numpy as np
-import pandas as pd
 import pyvisa
 from pycicl.rigol.oscilloscope import RigolMSO5
 from pycicl.siglent.siggen import SiglentSDG
+from pycicl.stats import RunningStats
 
 @click.command()
 @click.option('--siggen_id', '-g', prompt='DS1022 VISA ID', help='VISA ID of the DS1022 signal generator')
@@ -15,9 +16,12 @@ from pycicl.siglent.siggen import SiglentSDG
 @click.option('--frequency', '-f', default=13.56e6, help='frequency')
 @click.option('--min_vrms', '-m', default=0.3535, help='Starting Vrms')
 @click.option('--max_vrms', '-x', default=3.535, help='Ending Vrms')
-@click.option('--count', '-c', default=20, help='steps')
+@click.option('--count', '-c', default=20, help='Maximum number of low/high sample pairs')
 @click.option('--load', '-l', default=50, type=float, help='Current load')
-def run(siggen_id, scope_id, output, frequency, min_vrms, max_vrms, count, load):
+@click.option('--precision', '-p', default=None, type=float, help='Stop once the gain means are known to this relative precision')
+@click.option('--confidence', default=0.95, help='Confidence level used for --precision')
+@click.option('--min_count', default=5, help='Minimum number of sample pairs before stopping early')
+def run(siggen_id, scope_id, output, frequency, min_vrms, max_vrms, count, load, precision, confidence, min_count):
     rm = pyvisa.ResourceManager()
 
     siggen = SiglentSDG(siggen_id, rm)
@@ -39,9 +43,6 @@ def run(siggen_id, scope_id, output, frequency, min_vrms, max_vrms, count, load)
     siggen.ch1.enabled = True
     siggen.ch1.voltage_unit = 'VRMS'
 
-    data_low = []
-    data_high = []
-
     scope.clear_measurements()
 
     def format_freq(freq):
@@ -91,13 +92,33 @@ def run(siggen_id, scope_id, output, frequency, min_vrms, max_vrms, count, load)
         gain_v = vout_v / vin
         return frequency, vin_target, vin, iin, vout_i, vout_v, gain_i, gain_v
 
-    with click.progressbar(range(count), label='Performing voltage sweep') as bar:
-        for c in bar:
-           data_low.append(run_sample(min_vrms))
-           data_high.append(run_sample(max_vrms))
+    columns = ['Frequency', 'VinTarget', 'Vin', 'Iin', 'Vout_I', 'Vout_V', 'Gain_I', 'Gain_V']
+    gains = ['Gain_I', 'Gain_V']
+    stats_low = RunningStats(columns)
+    stats_high = RunningStats(columns)
+
+    def report(stats):
+        return ', '.join(f'{c}={stats.mean(c):.5g}±{stats.half_width(c, confidence):.2g}' for c in gains)
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['', *columns])
+        index = 0
+
+        for c in range(count):
+            for stats, vin_target in ((stats_low, min_vrms), (stats_high, max_vrms)):
+                row = run_sample(vin_target)
+                stats.update(row)
+                writer.writerow([index, *row])
+                index += 1
+            f.flush()
+
+            print(f'[{c + 1}/{count}] low: {report(stats_low)}; high: {report(stats_high)}')
+            if precision is not None and all(s.converged(gains, rel_precision=precision, confidence=confidence, min_count=min_count)
+                                             for s in (stats_low, stats_high)):
+                print(f'Repeatability established to {precision:g} after {c + 1} sample pairs')
+                break
 
-    df = pd.DataFrame(data=data_low + data_high, columns=['Frequency', 'VinTarget', 'Vin', 'Iin', 'Vout_I', 'Vout_V', 'Gain_I', 'Gain_V'])
-    df.to_csv(output)
     print(f'wrote to {output}')
 
 
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import click
+import socketserver
+import threading
+import pyvisa
+from pycicl.transport import SocketResource, measure_latency, measure_throughput
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    """Answers *IDN? with an identity string and WAV:DATA? with a binary block, like a scope would"""
+    block_size = 0
+
+    def handle(self):
+        payload = bytes(self.block_size)
+        length = str(len(payload))
+        block = f'#{len(length)}{length}'.encode() + payload + b'\n'
+
+        for line in self.rfile:
+            command = line.strip().upper()
+            if command == b'*IDN?':
+                self.wfile.write(b'PYCICL,STAND-IN,0,0\n')
+            elif command == b'WAV:DATA?':
+                self.wfile.write(block)
+
+
+class StandInServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@click.command()
+@click.option('--address', '-a', default=None, help='tcp://host:port of a real instrument to test instead of the local stand-in')
+@click.option('--block_size', '-b', default=8_000_000, help='Stand-in waveform size in bytes')
+@click.option('--count', '-c', default=200, help='Number of latency round trips')
+@click.option('--waveforms', '-w', default=10, help='Number of waveform reads')
+@click.option('--waveform_query', '-q', default='WAV:DATA?', help='Query returning a binary block')
+def run(address, block_size, count, waveforms, waveform_query):
+    if address is None:
+        StandInHandler.block_size = block_size
+        server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        print(f'Stand-in listening on {host}:{port}')
+    else:
+        host, port = address.lower().removeprefix('tcp://').rsplit(':', 1)
+        port = int(port)
+
+    resources = {'socket': lambda: SocketResource(host, port, timeout=10000)}
+
+    def open_visa():
+        resource = pyvisa.ResourceManager('@py').open_resource(f'TCPIP::{host}::{port}::SOCKET')
+        resource.read_termination = '\n'
+        resource.write_termination = '\n'
+        resource.timeout = 10000
+        return resource
+    resources['pyvisa'] = open_visa
+
+    for name, opener in resources.items():
+        try:
+            resource = opener()
+        except Exception as e:
+            print(f'{name}: unavailable ({e})')
+            continue
+
+        latency = measure_latency(resource, count=count)
+        throughput = measure_throughput(resource, waveform_query, count=waveforms)
+        print(f'{name}: {latency * 1e6:.1f} us round trip, {throughput / 1e6:.1f} MB/s waveform throughput')
+        resource.close()
+
+
+if __name__ == '__main__':
+    run()